@@ -13,22 +13,129 @@
 r"""Routines for fetching the glaciological data sets used in the demos"""
 
 import os
+import json
+import pathlib
+import tempfile
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from getpass import getpass
 import pkg_resources
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import tqdm
 import pooch
 import warnings
 
 
 pooch.get_logger().setLevel("WARNING")
 
+# Connect and read timeouts in seconds for every HTTP request we make
+_timeout = (30, 60)
 
-class EarthDataDownloader:
-    def __init__(self):
+_earthdata_login_host = "urs.earthdata.nasa.gov"
+
+
+def _make_session():
+    r"""Create an HTTP session that keeps connections alive between requests
+    and retries on transient server errors"""
+    retry = Retry(
+        total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _download(session, url, output_file, chunk_size=1024 * 1024, **kwargs):
+    r"""Stream the contents of a URL to a file in fixed-size chunks
+
+    A progress bar is shown only when downloading from the main thread, since
+    bars drawn from several worker threads at once garble the terminal; see
+    `_fetch_nsidc` for the progress shown for pooled downloads instead.
+    """
+    ispath = not hasattr(output_file, "write")
+    if ispath:
+        output_file = open(output_file, "w+b")
+
+    try:
+        with session.get(url, stream=True, timeout=_timeout, **kwargs) as response:
+            response.raise_for_status()
+            total = int(response.headers.get("content-length", 0))
+            progress = tqdm.tqdm(
+                total=total,
+                ncols=79,
+                ascii=True,
+                unit="B",
+                unit_scale=True,
+                disable=threading.current_thread() is not threading.main_thread(),
+            )
+            with progress:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        output_file.write(chunk)
+                        progress.update(len(chunk))
+    finally:
+        if ispath:
+            output_file.close()
+
+
+class _SessionDownloader:
+    r"""A pooch downloader that keeps its HTTP connections open between files
+    instead of reconnecting for each one"""
+
+    def __init__(self, chunk_size=1024 * 1024):
+        self._chunk_size = chunk_size
+        self._local = threading.local()
+        self._cookies = requests.cookies.RequestsCookieJar()
+        self._worker_sessions = []
+        self._worker_sessions_lock = threading.Lock()
+
+    def _get_session(self):
+        # Sessions aren't guaranteed to be thread-safe, so each thread that
+        # downloads through this object gets its own. They all share one
+        # cookie jar so that a login in one thread is seen by the others.
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = _make_session()
+            session.cookies = self._cookies
+            self._local.session = session
+            if threading.current_thread() is not threading.main_thread():
+                with self._worker_sessions_lock:
+                    self._worker_sessions.append(session)
+        return session
+
+    def _close_worker_sessions(self):
+        r"""Close the sessions made by worker threads, which can't be reused
+        once the thread pool that they came from has shut down"""
+        with self._worker_sessions_lock:
+            sessions, self._worker_sessions = self._worker_sessions, []
+        for session in sessions:
+            session.close()
+
+    def __call__(self, url, output_file, dataset):
+        _download(self._get_session(), url, output_file, self._chunk_size)
+
+
+class EarthDataDownloader(_SessionDownloader):
+    def __init__(self, chunk_size=1024 * 1024):
+        super().__init__(chunk_size)
         self._username = None
         self._password = None
+        self._lock = threading.Lock()
 
     def _get_credentials(self):
+        username, password = self._username, self._password
+        if username is not None and password is not None:
+            return username, password
+
+        with self._lock:
+            return self._get_credentials_unlocked()
+
+    def _get_credentials_unlocked(self):
         if self._username is None:
             username_env = os.environ.get("EARTHDATA_USERNAME")
             if username_env is None:
@@ -45,14 +152,37 @@ class EarthDataDownloader:
 
         return self._username, self._password
 
+    def _resolve(self, url):
+        r"""Follow the redirects for a URL without downloading the body of the
+        response
+
+        No credentials are sent here; if the session doesn't already have a
+        login cookie, this ends at the EarthData login page.
+        """
+        session = self._get_session()
+        response = session.head(url, allow_redirects=True, timeout=_timeout)
+        if response.ok:
+            return response.url
+
+        # Some of the EarthData login endpoints reject HEAD requests; fall back
+        # to a streamed GET, which we close as soon as the headers are in
+        kwargs = {"stream": True, "allow_redirects": True, "timeout": _timeout}
+        with session.get(url, **kwargs) as response:
+            return response.url
+
     def __call__(self, url, output_file, dataset):
-        auth = self._get_credentials()
-        downloader = pooch.HTTPDownloader(auth=auth, progressbar=True)
+        session = self._get_session()
         try:
-            login = requests.get(url)
-            downloader(login.url, output_file, dataset)
+            resolved_url = self._resolve(url)
+            # Only the login server gets the username and password; any other
+            # host, e.g. the data server once we have a cookie, gets none
+            kwargs = {}
+            if urllib.parse.urlparse(resolved_url).hostname == _earthdata_login_host:
+                kwargs["auth"] = self._get_credentials()
+            _download(session, resolved_url, output_file, self._chunk_size, **kwargs)
         except requests.exceptions.HTTPError as error:
-            if "Unauthorized" in str(error):
+            response = error.response
+            if response is not None and response.status_code == 401:
                 pooch.get_logger().error("Wrong username/password!")
                 self._username = None
                 self._password = None
@@ -60,44 +190,148 @@ class EarthDataDownloader:
 
 
 _earthdata_downloader = EarthDataDownloader()
+_decompress = pooch.Decompress()
+
 
+_cache_path = pathlib.Path(pooch.os_cache("icepack")).expanduser().resolve()
 
-nsidc_data = pooch.create(path=pooch.os_cache("icepack"), base_url="", registry=None)
+nsidc_data = pooch.create(path=_cache_path, base_url="", registry=None)
 
 registry_nsidc = pkg_resources.resource_stream("icepack", "registry-nsidc.txt")
 nsidc_data.load_registry(registry_nsidc)
 
 
+_verified_lock = threading.Lock()
+_verified_filename = str(_cache_path / "verified-hashes.json")
+
+
+def _load_verified():
+    try:
+        with open(_verified_filename, "r") as verified_file:
+            verified = json.load(verified_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    return verified if isinstance(verified, dict) else {}
+
+
+def _stamp(path, known_hash):
+    stat = os.stat(path)
+    return {"hash": known_hash, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def _fetch_verified(pup, filename, **kwargs):
+    r"""Fetch a file with pooch, skipping the hash check if the file on disk
+    hasn't changed since the last time it was verified
+
+    Pooch computes the SHA256 of a cached file every time it's fetched, which
+    for the larger data sets takes longer than anything else we do with them.
+    Instead we record the size and modification time of every file that passed
+    the check and only hand it back to pooch if either of those have changed.
+    """
+    path = os.path.join(pup.abspath, filename)
+    known_hash = pup.registry[filename]
+    with _verified_lock:
+        entry = _load_verified().get(path)
+
+    if entry is not None:
+        try:
+            stamp = _stamp(path, known_hash)
+            if entry["stamp"] == stamp and os.path.exists(entry["result"]):
+                return entry["result"]
+        except (FileNotFoundError, KeyError, TypeError):
+            # A missing file or an entry in the wrong shape is just a miss
+            pass
+
+    result = pup.fetch(filename, **kwargs)
+    with _verified_lock:
+        # Other processes can be updating the same file; the write is atomic,
+        # but concurrent updates can be lost, which only means the affected
+        # files get verified again next time
+        verified = _load_verified()
+        verified[path] = {"stamp": _stamp(path, known_hash), "result": result}
+        directory = os.path.dirname(_verified_filename)
+        fd, temp_filename = tempfile.mkstemp(dir=directory, suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as verified_file:
+                json.dump(verified, verified_file)
+            os.replace(temp_filename, _verified_filename)
+        except BaseException:
+            os.remove(temp_filename)
+            raise
+
+    return result
+
+
+def clear_verification_cache():
+    r"""Forget which downloaded files have already had their hashes checked,
+    so that the next fetch of each one checks it again"""
+    with _verified_lock:
+        try:
+            os.remove(_verified_filename)
+        except FileNotFoundError:
+            pass
+
+
+def _fetch_nsidc_file(filename, **kwargs):
+    return _fetch_verified(
+        nsidc_data, filename, downloader=_earthdata_downloader, **kwargs
+    )
+
+
+def _fetch_nsidc(filenames, workers=8, **kwargs):
+    r"""Fetch several files from NSIDC, downloading up to `workers` of them
+    concurrently"""
+    def fetch(filename):
+        return _fetch_nsidc_file(filename, **kwargs)
+
+    if workers <= 1 or len(filenames) <= 1:
+        return [fetch(filename) for filename in filenames]
+
+    # The workers don't draw progress bars for each file, so show one bar for
+    # how many of the files are done instead
+    progress = tqdm.tqdm(total=len(filenames), ncols=79, ascii=True, unit="file")
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(filenames))) as executor:
+            futures = [executor.submit(fetch, filename) for filename in filenames]
+            with progress:
+                for future in as_completed(futures):
+                    progress.update(1)
+            return [future.result() for future in futures]
+    finally:
+        _earthdata_downloader._close_worker_sessions()
+
+
 def fetch_measures_antarctica():
     r"""Fetch the MEaSUREs Antarctic velocity map"""
-    return nsidc_data.fetch(
-        "antarctic_ice_vel_phase_map_v01.nc", downloader=_earthdata_downloader
-    )
+    return _fetch_nsidc_file("antarctic_ice_vel_phase_map_v01.nc")
 
 
-def fetch_measures_greenland():
-    r"""Fetch the MEaSUREs Greenland velocity map"""
-    return [
-        nsidc_data.fetch(
-            f"greenland_vel_mosaic200_2015_2016_{field_name}_v02.1.tif",
-            downloader=_earthdata_downloader,
-        )
-        for field_name in ["vx", "vy", "ex", "ey"]
-    ]
+def fetch_measures_greenland(workers=8):
+    r"""Fetch the MEaSUREs Greenland velocity map
+
+    The velocity components and their errors are stored in separate files;
+    up to `workers` of them are downloaded at once.
+    """
+    return _fetch_nsidc(
+        [
+            f"greenland_vel_mosaic200_2015_2016_{field_name}_v02.1.tif"
+            for field_name in ["vx", "vy", "ex", "ey"]
+        ],
+        workers=workers,
+    )
 
 
 def fetch_bedmachine_antarctica():
     r"""Fetch the BedMachine map of Antarctic ice thickness, surface elevation,
     and bed elevation"""
-    return nsidc_data.fetch(
-        "BedMachineAntarctica_2020-07-15_v02.nc", downloader=_earthdata_downloader
-    )
+    return _fetch_nsidc_file("BedMachineAntarctica_2020-07-15_v02.nc")
 
 
 outlines_url = "https://raw.githubusercontent.com/icepack/glacier-meshes/"
 outlines_commit = "c98a8b7536b1891611566257d944e5ea024f2cdf"
 outlines = pooch.create(
-    path=pooch.os_cache("icepack"),
+    path=_cache_path,
     base_url=outlines_url + outlines_commit + "/glaciers/",
     registry=None,
 )
@@ -105,23 +339,31 @@ outlines = pooch.create(
 registry_outlines = pkg_resources.resource_stream("icepack", "registry-outlines.txt")
 outlines.load_registry(registry_outlines)
 
+_outline_downloader = _SessionDownloader()
+
+
+_glacier_names = tuple(
+    sorted(
+        os.path.splitext(os.path.basename(filename))[0]
+        for filename in outlines.registry.keys()
+    )
+)
+_glacier_name_set = frozenset(_glacier_names)
+
 
 def get_glacier_names():
     r"""Return the names of the glaciers for which we have outlines that you
     can fetch"""
-    return [
-        os.path.splitext(os.path.basename(filename))[0]
-        for filename in outlines.registry.keys()
-    ]
+    return list(_glacier_names)
 
 
 def fetch_outline(name):
     r"""Fetch the outline of a glacier as a GeoJSON file"""
-    names = get_glacier_names()
-    if name not in names:
-        raise ValueError("Glacier name '%s' not in %s" % (name, names))
-    downloader = pooch.HTTPDownloader(progressbar=True)
-    return outlines.fetch(name + ".geojson", downloader=downloader)
+    if name not in _glacier_name_set:
+        raise ValueError("Glacier name '%s' not in %s" % (name, _glacier_names))
+    # The outlines live at a fixed commit, so once one has been downloaded and
+    # verified there's nothing to revalidate against the server
+    return _fetch_verified(outlines, name + ".geojson", downloader=_outline_downloader)
 
 
 def fetch_larsen_outline():
@@ -134,8 +376,4 @@ def fetch_larsen_outline():
 
 def fetch_mosaic_of_antarctica():
     r"""Fetch the MODIS optical image mosaic of Antarctica"""
-    return nsidc_data.fetch(
-        "moa750_2009_hp1_v01.1.tif.gz",
-        downloader=_earthdata_downloader,
-        processor=pooch.Decompress(),
-    )
+    return _fetch_nsidc_file("moa750_2009_hp1_v01.1.tif.gz", processor=_decompress)
@@ -0,0 +1,154 @@
+# Copyright (C) 2021 by Daniel Shapero <shapero@uw.edu>
+#
+# This file is part of icepack.
+#
+# icepack is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The full text of the license can be found in the file LICENSE in the
+# icepack source directory or at <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import pooch
+import pytest
+import icepack.datasets
+from icepack.datasets import _fetch_verified
+
+
+class StubDownloader:
+    def __init__(self, contents):
+        self.contents = contents
+        self.calls = 0
+
+    def __call__(self, url, output_file, pup):
+        self.calls += 1
+        with open(output_file, "wb") as output:
+            output.write(self.contents)
+
+
+def make_registry(path, contents, monkeypatch):
+    known_hash = hashlib.sha256(contents).hexdigest()
+    pup = pooch.create(
+        path=path, base_url="https://example.com/", registry={"data.txt": known_hash}
+    )
+
+    pup.fetch_calls = 0
+    fetch = pup.fetch
+
+    def counting_fetch(*args, **kwargs):
+        pup.fetch_calls += 1
+        return fetch(*args, **kwargs)
+
+    monkeypatch.setattr(pup, "fetch", counting_fetch)
+    return pup
+
+
+def test_fetching_unknown_outline():
+    with pytest.raises(ValueError):
+        icepack.datasets.fetch_outline("not-a-glacier")
+
+
+@pytest.fixture
+def verified_filename(tmp_path, monkeypatch):
+    filename = str(tmp_path / "verified-hashes.json")
+    monkeypatch.setattr(icepack.datasets, "_verified_filename", filename)
+    return filename
+
+
+def test_fetching_verified_file_twice(tmp_path, monkeypatch, verified_filename):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    downloader = StubDownloader(contents)
+
+    path = _fetch_verified(pup, "data.txt", downloader=downloader)
+    assert os.path.exists(verified_filename)
+    assert downloader.calls == 1
+    assert pup.fetch_calls == 1
+
+    assert _fetch_verified(pup, "data.txt", downloader=downloader) == path
+    assert downloader.calls == 1
+    assert pup.fetch_calls == 1
+
+
+def test_changing_mtime_or_size(tmp_path, monkeypatch, verified_filename):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    downloader = StubDownloader(contents)
+    path = _fetch_verified(pup, "data.txt", downloader=downloader)
+
+    # Touching the file makes pooch check the hash again, but the hash still
+    # matches so there's no need to download it again
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    _fetch_verified(pup, "data.txt", downloader=downloader)
+    assert pup.fetch_calls == 2
+    assert downloader.calls == 1
+
+    # Corrupting the file should make pooch fetch it again
+    with open(path, "ab") as data_file:
+        data_file.write(b"berg")
+    _fetch_verified(pup, "data.txt", downloader=downloader)
+    assert pup.fetch_calls == 3
+    assert downloader.calls == 2
+    with open(path, "rb") as data_file:
+        assert data_file.read() == contents
+
+
+def test_changing_registry_hash(tmp_path, monkeypatch, verified_filename):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    _fetch_verified(pup, "data.txt", downloader=StubDownloader(contents))
+
+    new_contents = b"firn"
+    pup = make_registry(tmp_path / "cache", new_contents, monkeypatch)
+    downloader = StubDownloader(new_contents)
+    path = _fetch_verified(pup, "data.txt", downloader=downloader)
+    assert pup.fetch_calls == 1
+    assert downloader.calls == 1
+    with open(path, "rb") as data_file:
+        assert data_file.read() == new_contents
+
+
+def test_clearing_verification_cache(tmp_path, monkeypatch, verified_filename):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    downloader = StubDownloader(contents)
+    _fetch_verified(pup, "data.txt", downloader=downloader)
+
+    icepack.datasets.clear_verification_cache()
+    assert not os.path.exists(verified_filename)
+    _fetch_verified(pup, "data.txt", downloader=downloader)
+    assert pup.fetch_calls == 2
+    assert downloader.calls == 1
+
+
+@pytest.mark.parametrize("entry", [None, [], "data.txt", {}, {"stamp": {}}])
+def test_malformed_verification_cache(tmp_path, monkeypatch, verified_filename, entry):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    downloader = StubDownloader(contents)
+    path = _fetch_verified(pup, "data.txt", downloader=downloader)
+
+    with open(verified_filename, "w") as verified_file:
+        json.dump({path: entry}, verified_file)
+
+    assert _fetch_verified(pup, "data.txt", downloader=downloader) == path
+    assert pup.fetch_calls == 2
+    assert downloader.calls == 1
+
+
+def test_verification_cache_not_a_dict(tmp_path, monkeypatch, verified_filename):
+    contents = b"ice"
+    pup = make_registry(tmp_path / "cache", contents, monkeypatch)
+    downloader = StubDownloader(contents)
+    path = _fetch_verified(pup, "data.txt", downloader=downloader)
+
+    with open(verified_filename, "w") as verified_file:
+        json.dump([path], verified_file)
+
+    assert _fetch_verified(pup, "data.txt", downloader=downloader) == path
+    assert pup.fetch_calls == 2
@@ -24,7 +24,7 @@ def needs_snapping():
         [(0.0, -1e-6), (1.0, 0.0), (1.0, 1.0 - 1e-6)],
         [(1.0, 1.0 + 1e-6), (0.0, 1.0), (0.0, 1e-6)],
     ]
-    multi_line_string = geojson.MultiLineString(coords, validate=True)
+    multi_line_string = geojson.MultiLineString(coords, validate=False)
     feature = geojson.Feature(geometry=multi_line_string, properties={})
     return geojson.FeatureCollection([feature])
 
@@ -34,20 +34,20 @@ def needs_reorienting():
         [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)],
         [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)],
     ]
-    multi_line_string = geojson.MultiLineString(coords, validate=True)
+    multi_line_string = geojson.MultiLineString(coords, validate=False)
     feature = geojson.Feature(geometry=multi_line_string, properties={})
     return geojson.FeatureCollection([feature])
 
 
 def has_interior():
     coords = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0), (0.0, 0.0)]
-    outer_line_string = geojson.LineString(coords, validate=True)
+    outer_line_string = geojson.LineString(coords, validate=False)
 
     r = 1 / 8
-    coords = [
-        (0.5 + r * np.cos(θ), 0.5 + r * np.sin(θ)) for θ in np.linspace(0, 2 * π, 256)
-    ]
-    inner_line_string = geojson.LineString(coords, validate=True)
+    θ = np.linspace(0, 2 * π, 256)
+    xs, ys = 0.5 + r * np.cos(θ), 0.5 + r * np.sin(θ)
+    coords = list(map(tuple, np.column_stack([xs, ys]).tolist()))
+    inner_line_string = geojson.LineString(coords, validate=False)
 
     outer_feature = geojson.Feature(geometry=outer_line_string, properties={})
     inner_feature = geojson.Feature(geometry=inner_line_string, properties={})
@@ -85,20 +85,20 @@ def test_converting_to_triangle(input_data):
     assert mesh.num_cells() > 0
 
 
-def test_meshing_real_outlines(tmp_path):
-    for glacier_name in icepack.datasets.get_glacier_names():
-        outline_filename = icepack.datasets.fetch_outline(glacier_name)
-        with open(outline_filename, "r") as outline_file:
-            outline = geojson.load(outline_file)
+@pytest.mark.parametrize("glacier_name", icepack.datasets.get_glacier_names())
+def test_meshing_real_outline(tmp_path, glacier_name):
+    outline_filename = icepack.datasets.fetch_outline(glacier_name)
+    with open(outline_filename, "r") as outline_file:
+        outline = geojson.load(outline_file)
 
-        geometry = icepack.meshing.collection_to_geo(outline)
-        geo_filename = f"{tmp_path}/{glacier_name}.geo"
-        with open(geo_filename, "w") as geo_file:
-            geo_file.write(geometry.get_code())
+    geometry = icepack.meshing.collection_to_geo(outline)
+    geo_filename = f"{tmp_path}/{glacier_name}.geo"
+    with open(geo_filename, "w") as geo_file:
+        geo_file.write(geometry.get_code())
 
-        msh_filename = f"{tmp_path}/{glacier_name}.msh"
-        args = ["gmsh", "-2", "-v", "3", "-o", msh_filename, geo_filename]
-        result = subprocess.run(args)
-        assert result.returncode == 0
-        mesh = firedrake.Mesh(msh_filename)
-        assert mesh.num_cells() > 0
+    msh_filename = f"{tmp_path}/{glacier_name}.msh"
+    args = ["gmsh", "-2", "-v", "3", "-o", msh_filename, geo_filename]
+    result = subprocess.run(args)
+    assert result.returncode == 0
+    mesh = firedrake.Mesh(msh_filename)
+    assert mesh.num_cells() > 0